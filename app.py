@@ -2,9 +2,22 @@
 import sqlite3
 import os
 import secrets
+import hmac
+import queue
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 from functools import wraps
+from urllib.parse import urlencode
 from flask import Flask,render_template, session, redirect, url_for, request, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_caching import Cache
+from flask_session import Session
+from cachelib import FileSystemCache
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import check_password_hash
+import bcrypt
+
+from database import DB_PATH, init_db
 
 # --------------------------------------------------
 # App & Config
@@ -14,63 +27,154 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev_fallback_secret")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "sports_store.db")
+
+# Persist compiled templates so restarted workers skip Jinja compilation
+JINJA_CACHE_DIR = os.path.join(BASE_DIR, ".jinja_cache")
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory=JINJA_CACHE_DIR)
+
+# Keep the cart server-side; the cookie only carries the session id
+app.config["SESSION_TYPE"] = "cachelib"
+# Browser-session cookie, as with Flask's default signed-cookie sessions
+app.config["SESSION_PERMANENT"] = False
+app.config["SESSION_CACHELIB"] = FileSystemCache(
+    cache_dir=os.path.join(BASE_DIR, ".flask_session"), threshold=5000
+)
+Session(app)
+
+# Rendered-page cache for the routes that carry no per-user state
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300})
 
 #--------------------------------------------------
 # Database Helpers
 #--------------------------------------------------
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    print("INIT_DB: starting")
-    
-    conn = get_db()
-    cursor = conn.cursor()
-   
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            price REAL NOT NULL,
-            category TEXT NOT NULL,
-            image TEXT NOT NULL
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+STATEMENT_CACHE_SIZE = 256
+
+class ConnectionPool:
+    """Fixed-size pool of pre-opened, pre-configured SQLite connections."""
+
+    def __init__(self, db_path, size=5):
+        self._db_path = db_path
+        self._size = size
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _connect(db_path):
+        conn = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE,
         )
-   """)
-
-    # Seed products ONLY if empty
-    cursor.execute("SELECT COUNT(*) FROM products")
-    count = cursor.fetchone()[0]
-    
-    print("INIT_DB: product count =", count)
-      
-    if count == 0:
-        cursor.executemany("""
-            INSERT INTO products (name, price, category, image)
-            VALUES (?, ?, ?, ?)
-       """, [
-            ("Football", 499, "Outdoor", "football.jpeg"),
-            ("Cricket Bat", 1299, "Outdoor", "cricket_bat.jpeg"),
-            ("Tennis Racket", 999, "Indoor", "tennis_racket.jpeg"),
-            ("Dumbbells", 999, "Fitness", "dumbbells.jpeg"),
-            ("Yoga Mat", 699, "Fitness", "yoga_mat.jpeg")   
-       ])
-    print("INIT_DB: products inserted")
-    
-    conn.commit()
-    conn.close()
-    print("INIT_DB: done")
+        conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _ensure_pool(self):
+        # Connections are opened lazily in whichever process first needs
+        # them, so a preloading gunicorn master never holds any and forked
+        # workers never use (or close) one carried across fork()
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            pool = queue.Queue(maxsize=self._size)
+            for _ in range(self._size):
+                pool.put(self._connect(self._db_path))
+            self._pool = pool
+            self._pid = os.getpid()
+
+    def get(self):
+        self._ensure_pool()
+        return self._pool.get()
+
+    def put(self, conn):
+        self._pool.put(conn)
+
+db_pool = ConnectionPool(DB_PATH, size=int(os.environ.get("DB_POOL_SIZE", 5)))
+
+@contextmanager
+def get_db():
+    conn = db_pool.get()
+    try:
+        yield conn
+    finally:
+        db_pool.put(conn)
+
+# Catalog cache: refreshed lazily whenever catalog_meta.version moves on.
+# The version lives in SQLite (bumped by triggers) so every worker process
+# notices writes made by any other process.
+_PRODUCTS_CACHE = {"v": None, "data": None, "by_name": None}
+_CATALOG_LOCK = threading.Lock()
+
+def _catalog_version(conn):
+    return conn.execute("SELECT version FROM catalog_meta").fetchone()[0]
+
+def _load_catalog():
+    cache = _PRODUCTS_CACHE
+    with get_db() as conn:
+        if cache["data"] is not None and cache["v"] == _catalog_version(conn):
+            return cache
+
+    with _CATALOG_LOCK:
+        with get_db() as conn:
+            # Read the version first: a write landing in between only
+            # causes one extra refresh, never a stale cache
+            version = _catalog_version(conn)
+            if cache["data"] is None or cache["v"] != version:
+                cursor = conn.cursor()
+                cursor.execute("SELECT * FROM products")
+                products = cursor.fetchall()
+                cache["data"] = products
+                cache["by_name"] = {p["name"]: p for p in products}
+                cache["v"] = version
+    return cache
 
 def get_products():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products")
-    products = cursor.fetchall()
-    conn.close()
-    return products
+    return _load_catalog()["data"]
+
+def get_products_by_name():
+    return _load_catalog()["by_name"]
+
+FTS_MIN_QUERY_LENGTH = 3
+
+def fts_phrase(query):
+    # Quote as a single FTS5 phrase so user input can't inject MATCH syntax
+    return '"' + query.replace('"', '""') + '"'
+
+def _product_search_sql(search, by_category):
+    sql = "SELECT products.* FROM products"
+    if search == "fts":
+        sql += " JOIN products_fts ON products_fts.rowid = products.id"
+    sql += " WHERE 1=1"
+    if search == "fts":
+        sql += " AND products_fts MATCH ?"
+    elif search == "like":
+        sql += " AND products.name LIKE ?"
+    if by_category:
+        sql += " AND products.category = ?"
+    return sql + " ORDER BY products.id"
+
+# Every /products query is one of these fixed strings, so each pooled
+# connection's statement cache always hits after the first request
+PRODUCT_SEARCH_SQL = {
+    (search, by_category): _product_search_sql(search, by_category)
+    for search in (None, "fts", "like")
+    for by_category in (False, True)
+}
 
 # --------------------------------------------------
 # Security Helpers (CSRF)
@@ -78,7 +182,7 @@ def get_products():
 
 def generate_csrf_token():
     if "_csrf_token" not in session:
-        session["_csrf_token"] = secrets.token_hex[16]
+        session["_csrf_token"] = secrets.token_hex(16)
     return session["_csrf_token"]    
 
 app.jinja_env.globals["csrf_token"] = generate_csrf_token
@@ -86,18 +190,41 @@ app.jinja_env.globals["csrf_token"] = generate_csrf_token
 def verify_csrf():
     session_token = session.get("_csrf_token")
     form_token = request.form.get("csrf_token")
-    return bool(session_token and form_token and session_token == form_token)
+    # compare_digest rejects non-ASCII str, and form_token is client-controlled
+    return bool(session_token) and bool(form_token) and hmac.compare_digest(
+        session_token.encode(), form_token.encode()
+    )
 
 # --------------------------------------------------
 # Security Helpers (Passwords / Auth)
 # --------------------------------------------------
 
+# Cost 11 measured at ~180 ms per verify; override per host with BCRYPT_ROUNDS
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 11))
+BCRYPT_PREFIX = "$2b$"
+# bcrypt only looks at the first 72 bytes and bcrypt>=5 rejects anything longer
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+def password_too_long(password: str) -> bool:
+    return len(password.encode()) > BCRYPT_MAX_PASSWORD_BYTES
+
 def hash_password(password: str) -> str:
-    return generate_password_hash(password)
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode(), salt).decode()
 
 def verify_password(password: str, password_hash: str) -> bool:
+    if password_hash.startswith(BCRYPT_PREFIX):
+        if password_too_long(password):
+            return False
+        return bcrypt.checkpw(password.encode(), password_hash.encode())
+    # Legacy Werkzeug (pbkdf2/scrypt) hashes
     return check_password_hash(password_hash, password)
 
+def password_needs_rehash(password_hash: str) -> bool:
+    if not password_hash.startswith(BCRYPT_PREFIX):
+        return True
+    return int(password_hash.split("$")[2]) != BCRYPT_ROUNDS
+
 # --------------------------------------------------
 # Admin Decorator (DEFINE BEFORE ROUTES)
 # --------------------------------------------------
@@ -110,6 +237,9 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Product names are UNIQUE (the cart is keyed by name)
+DUPLICATE_PRODUCT_MESSAGE = "A product with that name already exists."
+
 def validate_product_form(name, price, category, image):
     if not name or not price or not category or not image:
         return "All fields are required."
@@ -125,40 +255,61 @@ def validate_product_form(name, price, category, image):
     
     return None
 
+def product_display(product):
+    # Precompute per-row display fields so listing templates only interpolate
+    item = dict(product)
+    item["price_formatted"] = f"₹{product['price']:.2f}"
+    item["image_url"] = url_for("static", filename="images/" + product["image"])
+    return item
+
 # --------------------------------------------------
 # Public Routes
 # --------------------------------------------------
 
+def products_cache_key():
+    # Include the catalog version so an admin write in any worker expires
+    # every cached listing instead of waiting out the timeout
+    with get_db() as conn:
+        version = _catalog_version(conn)
+    return f"products:{version}:{urlencode(sorted(request.args.items(multi=True)))}"
+
 @app.route("/")
+@cache.cached(timeout=300)
 def home():
     return render_template("index.html")
 
 @app.route("/products")
+@cache.cached(timeout=60, make_cache_key=products_cache_key)
 def product_page():
     query = request.args.get("q", "").strip()
     category = request.args.get("category", "").strip()
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    sql = "SELECT * FROM products WHERE 1=1"
+    # The trigram tokenizer needs at least 3 characters; shorter terms use LIKE
     params = []
     
-    if query:
-        sql += " AND name LIKE ?"
+    if len(query) >= FTS_MIN_QUERY_LENGTH:
+        search = "fts"
+        params.append(fts_phrase(query))
+    elif query:
+        search = "like"
         params.append(f"%{query}%")
+    else:
+        search = None
     
     if category:
-        sql += " AND category = ?"
         params.append(category)
     
-    cursor.execute(sql, params)
-    products = cursor.fetchall()
-    conn.close()
+    sql = PRODUCT_SEARCH_SQL[(search, bool(category))]
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        products = [product_display(p) for p in cursor.fetchall()]
 
     return render_template("products.html", products=products, query=query, category=category)
 
 @app.route("/contact")
+@cache.cached(timeout=300)
 def contact():
     return render_template("contact.html")
 
@@ -166,19 +317,25 @@ def contact():
 # Cart Routes
 # --------------------------------------------------
 
-@app.route("/add_to_cart/<product_name>")
-def add_to_cart(product_name):
-    cart = session.get("cart")
+# Only the columns the cart/checkout templates actually render
+CartRow = namedtuple("CartRow", "id name price image qty subtotal")
 
-    # SAFETY: migrate old list-based cart to dict
-    if isinstance(cart, list):
-        new_cart = {}
-        for item in cart:
-            new_cart[item] = new_cart.get(item, 0) + 1
-        cart = new_cart
+def _listcart_to_dict(cart):
+    new_cart = {}
+    for item in cart:
+        new_cart[item] = new_cart.get(item, 0) + 1
+    return new_cart
 
-    if cart is None:
-        cart = {}
+@app.before_request
+def migrate_cart():
+    # SAFETY: migrate old list-based cart to dict, once per session
+    if not session.get("_cart_migrated") and isinstance(session.get("cart"), list):
+        session["cart"] = _listcart_to_dict(session["cart"])
+        session["_cart_migrated"] = True
+
+@app.route("/add_to_cart/<product_name>")
+def add_to_cart(product_name):
+    cart = session.get("cart", {})
 
     cart[product_name] = cart.get(product_name, 0) + 1
 
@@ -203,25 +360,20 @@ def remove_from_cart(product_name):
 def cart():
     cart = session.get("cart", {})
 
-    # SAFETY: migrate old list-based cart to dict
-    if isinstance(cart, list):
-        new_cart = {}
-        for item in cart:
-            new_cart[item] = new_cart.get(item, 0) + 1
-        session["cart"] = new_cart
-        cart = new_cart
-
     cart_products = []
     total = 0
 
+    by_name = get_products_by_name()
+
     for name, qty in cart.items():
-        for product in get_products():
-            if product["name"] == name:
-                product_copy = dict(product)
-                product_copy["qty"] = qty
-                product_copy["subtotal"] = qty * product["price"]
-                total += product_copy["subtotal"]
-                cart_products.append(product_copy)
+        product = by_name.get(name)
+        if product is None:
+            continue
+        subtotal = qty * product["price"]
+        total += subtotal
+        cart_products.append(CartRow(
+            product["id"], product["name"], product["price"], product["image"], qty, subtotal
+        ))
 
     return render_template("cart.html", cart_products=cart_products, total=total)
 
@@ -254,14 +406,17 @@ def checkout():
     cart_products = []
     total = 0
 
+    catalog = get_products_by_name()
+
     for name, qty in cart.items():
-        for product in get_products():
-            if product["name"] == name:
-                item = dict(product)
-                item["qty"] = qty
-                item["subtotal"] = qty * product["price"]
-                total += item["subtotal"]
-                cart_products.append(item)
+        product = catalog.get(name)
+        if product is None:
+            continue
+        subtotal = qty * product["price"]
+        total += subtotal
+        cart_products.append(CartRow(
+            product["id"], product["name"], product["price"], product["image"], qty, subtotal
+        ))
 
     if "coupon" in session and session["coupon"] == "SPORTS10":
         discount = total * 0.10
@@ -285,7 +440,7 @@ def checkout():
 @admin_required
 def admin():
     
-    products = get_products()
+    products = [product_display(p) for p in get_products()]
     return render_template("admin.html", products=products)
 
 @app.route("/admin/add", methods=["POST"])
@@ -306,14 +461,17 @@ def admin_add():
         flash(error, "error")
         return redirect(url_for("admin"))
 
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO products (name, price, category, image) VALUES (?, ?, ?, ?)", 
-        (name, price, category, image)
-    )
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO products (name, price, category, image) VALUES (?, ?, ?, ?)", 
+                (name, price, category, image)
+            )
+        except sqlite3.IntegrityError:
+            flash(DUPLICATE_PRODUCT_MESSAGE, "error")
+            return redirect(url_for("admin"))
+        conn.commit()
     
     flash("Product added successfully!", "success")
     return redirect(url_for("admin"))
@@ -322,11 +480,10 @@ def admin_add():
 @admin_required
 def admin_delete(product_id):
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+        conn.commit()
     
     flash("Product deleted", "warning")
     return redirect(url_for("admin"))
@@ -334,17 +491,11 @@ def admin_delete(product_id):
 @app.route("/admin/edit/<int:product_id>")
 @admin_required
 def admin_edit(product_id):
-    if not admin_required():
-        return redirect(url_for("admin_login"))
-    
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with get_db() as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    product = cursor.fetchone()
-   
-    conn.close()
+        cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
+        product = cursor.fetchone()
     
     return render_template("admin_edit.html", product=product)
 
@@ -367,20 +518,22 @@ def admin_update(product_id):
             flash(error, "error")
             return redirect(url_for("admin"))
 
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with get_db() as conn:
+        cursor = conn.cursor()
 
-    # 🔒 If image is empty, keep existing one
-    if not image:
-        cursor.execute("SELECT image FROM products WHERE id = ?", (product_id,))
-        image = cursor.fetchone()["image"]
+        # 🔒 If image is empty, keep existing one
+        if not image:
+            cursor.execute("SELECT image FROM products WHERE id = ?", (product_id,))
+            image = cursor.fetchone()["image"]
 
-    sql = "UPDATE products SET name = ?, price = ?, category = ?, image = ? WHERE id = ?"
-    cursor.execute(sql, (name, price, category, image, product_id))
+        sql = "UPDATE products SET name = ?, price = ?, category = ?, image = ? WHERE id = ?"
+        try:
+            cursor.execute(sql, (name, price, category, image, product_id))
+        except sqlite3.IntegrityError:
+            flash(DUPLICATE_PRODUCT_MESSAGE, "error")
+            return redirect(url_for("admin"))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
 
     flash("Product updated successfully!", "info")
     return redirect(url_for("admin"))
@@ -399,19 +552,33 @@ def admin_login():
             flash("Username and password are required", "danger")
             return redirect(url_for("admin_login"))
         
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT password_hash FROM users WHERE username = ?", 
-            (username,)
-        )
-        user = cursor.fetchone()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT password_hash FROM users WHERE username = ?", 
+                (username,)
+            )
+            user = cursor.fetchone()
         
+        # bcrypt is deliberately slow, so don't hold a pooled connection while it runs
         if not user or not verify_password(password, user["password_hash"]):
             flash("Invalid username or password", "danger")
             return redirect(url_for("admin_login"))
+
+        # Upgrade old pbkdf2 / lower-cost hashes on successful login; legacy
+        # passwords too long for bcrypt keep their existing hash
+        if password_needs_rehash(user["password_hash"]) and not password_too_long(password):
+            new_hash = hash_password(password)
+            with get_db() as conn:
+                conn.execute(
+                    "UPDATE users SET password_hash = ? WHERE username = ?",
+                    (new_hash, username)
+                )
+                conn.commit()
         
+        # New session id on login so a planted session cookie can't become
+        # an admin session (session fixation)
+        app.session_interface.regenerate(session)
         session["admin_logged_in"] = True
         return redirect(url_for("admin"))
     
@@ -427,23 +594,33 @@ def register():
             flash("Username and password are required.", "danger")
             return redirect(url_for("register"))
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-        if cursor.fetchone():
-            conn.close()
-            flash("Username already exists.", "danger")
+        if password_too_long(password):
+            flash(f"Password must be at most {BCRYPT_MAX_PASSWORD_BYTES} bytes.", "danger")
             return redirect(url_for("register"))
         
+        with get_db() as conn:
+            cursor = conn.cursor()
+        
+            cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+            if cursor.fetchone():
+                flash("Username already exists.", "danger")
+                return redirect(url_for("register"))
+        
         password_hash = hash_password(password)
         
-        cursor.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-            (username, password_hash)
-        )
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            # The check above ran on another checkout, so a concurrent
+            # registration can still win the race; UNIQUE catches it
+            try:
+                cursor.execute(
+                    "INSERT INTO users (username, password_hash) VALUES (?, ?)", 
+                    (username, password_hash)
+                )
+            except sqlite3.IntegrityError:
+                flash("Username already exists.", "danger")
+                return redirect(url_for("register"))
+            conn.commit()
         
         flash("Account created successfully. Please log in.", "success")
         return redirect(url_for("admin_login"))
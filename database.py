@@ -1,25 +1,143 @@
 import sqlite3
 import os
+from contextlib import closing
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "sports_store.db")
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
+SEED_PRODUCTS = [
+    ("Football", 499, "Outdoor", "football.jpeg"),
+    ("Cricket Bat", 1299, "Outdoor", "cricket_bat.jpeg"),
+    ("Tennis Racket", 999, "Indoor", "tennis_racket.jpeg"),
+    ("Dumbbells", 999, "Fitness", "dumbbells.jpeg"),
+    ("Yoga Mat", 699, "Fitness", "yoga_mat.jpeg"),
+]
+
+# Bump whenever SCHEMA changes so existing databases pick it up on startup
+CURRENT_SCHEMA_VERSION = 2
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        price REAL NOT NULL,
+        category TEXT NOT NULL,
+        image TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    );
+
+    -- Catalog change counter, polled by the app's in-process product cache
+    CREATE TABLE IF NOT EXISTS catalog_meta (
+        version INTEGER NOT NULL
+    );
+    INSERT INTO catalog_meta (version)
+        SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM catalog_meta);
+    CREATE TRIGGER IF NOT EXISTS catalog_version_ai AFTER INSERT ON products BEGIN
+        UPDATE catalog_meta SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS catalog_version_ad AFTER DELETE ON products BEGIN
+        UPDATE catalog_meta SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS catalog_version_au AFTER UPDATE ON products BEGIN
+        UPDATE catalog_meta SET version = version + 1;
+    END;
+
+    CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
+    CREATE INDEX IF NOT EXISTS idx_products_name_nocase ON products(name COLLATE NOCASE);
+
+    -- Full-text index for product search, kept in sync by triggers
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, content='products', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+    END;
+"""
+
+# v0 -> v1: tables made before versioning (by the old app.py or database.py)
+# may lack UNIQUE on name or store price as INTEGER. Rebuild products,
+# keeping the oldest row for each duplicated name.
+REBUILD_PRODUCTS = """
+    CREATE TABLE products_v1 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        price REAL NOT NULL,
+        category TEXT NOT NULL,
+        image TEXT NOT NULL
+    );
+    INSERT INTO products_v1 (id, name, price, category, image)
+        SELECT id, name, price, category, image FROM products
+        WHERE id IN (SELECT MIN(id) FROM products GROUP BY name);
+    DROP TABLE products;
+    ALTER TABLE products_v1 RENAME TO products;
+"""
+
+def migrate(conn):
+    """Bring conn's database up to CURRENT_SCHEMA_VERSION; return True if DDL ran."""
     cursor = conn.cursor()
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            price INTEGER NOT NULL,
-            category TEXT NOT NULL,
-            image TEXT NOT NULL
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    if version >= CURRENT_SCHEMA_VERSION:
+        return False
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products'")
+    has_products = cursor.fetchone() is not None
+
+    # One transaction: user_version only moves once the schema matches it
+    script = ["BEGIN;"]
+    if version < 1 and has_products:
+        script.append(REBUILD_PRODUCTS)
+    script.append(SCHEMA)
+    # Re-index rows inserted before the FTS table existed or before a rebuild
+    script.append("INSERT INTO products_fts(products_fts) VALUES ('rebuild');")
+    script.append(f"PRAGMA user_version = {CURRENT_SCHEMA_VERSION};")
+    script.append("COMMIT;")
+    cursor.executescript("\n".join(script))
+    return True
+
+def init_db():
+    print("INIT_DB: starting")
+
+    # Short-lived connection: under gunicorn's preload_app this runs in the
+    # master, and it must be closed before workers fork
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        cursor = conn.cursor()
+
+        # WAL is persistent on the file, so every later connection inherits it
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+
+        if not migrate(conn):
+            print("INIT_DB: schema up to date")
+
+        # Seed products ONLY if empty
+        cursor.execute("SELECT COUNT(*) FROM products")
+        count = cursor.fetchone()[0]
+
+        print("INIT_DB: product count =", count)
+
+        if count == 0:
+            cursor.executemany(
+                "INSERT INTO products (name, price, category, image) VALUES (?, ?, ?, ?)",
+                SEED_PRODUCTS
+            )
+            print("INIT_DB: products inserted")
+
+        conn.commit()
+    print("INIT_DB: done")
 
 if __name__ == "__main__":
     init_db()
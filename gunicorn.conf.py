@@ -0,0 +1,12 @@
+import multiprocessing
+
+# Threaded workers; SQLite in WAL mode lets readers in every worker run
+# concurrently with the (single) writer
+workers = multiprocessing.cpu_count() * 2 + 1
+worker_class = "gthread"
+threads = 4
+
+# Import the app (schema check, Jinja setup) once in the master and fork it.
+# The master only touches SQLite through a short-lived connection in
+# init_db(); each worker opens its own pool on first use.
+preload_app = True